@@ -0,0 +1,79 @@
+# app.py — точка входа на Render (start.sh)
+# Порядок старта важен: Render ждёт ответа на /health, поэтому
+# 0) .env — раньше всего: модули читают env при импорте (DB_PATH, PHOTO_MAX_SIDE, ...)
+# 1) лок-файл (дёшево) — защита от второго polling и TelegramConflictError
+# 2) health web-server (/ и /health) — поднимаем до тяжёлых импортов;
+#    /stats — задержки и стоимость по тирам моделей (routing.py)
+# 3) только потом импортируем bot.py (aiogram, клиенты) и запускаем polling
+
+import os
+import sys
+import fcntl
+import asyncio
+import importlib
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+LOCK_FILE = "/tmp/quote_bot.lock"
+_lock_fd = None
+
+
+def acquire_lock() -> None:
+    global _lock_fd
+    _lock_fd = open(os.getenv("LOCK_FILE", LOCK_FILE), "w")
+    try:
+        fcntl.flock(_lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("Another instance is already running. Exiting.")
+        sys.exit(0)
+
+
+# ===== Web server for Render =====
+async def start_web_server():
+    from aiohttp import web
+
+    app = web.Application()
+
+    async def health(request):
+        return web.Response(text="OK")
+
+    async def stats(request):
+        from routing import get_router
+
+        return web.json_response(get_router().stats())
+
+    app.router.add_get("/", health)
+    app.router.add_get("/health", health)
+    app.router.add_get("/stats", stats)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    port = int(os.getenv("PORT", "10000"))
+    site = web.TCPSite(runner, host="0.0.0.0", port=port)
+    await site.start()
+
+    print(f"✅ Web server started on 0.0.0.0:{port}")
+    return runner
+
+
+async def serve():
+    runner = await start_web_server()
+    try:
+        # импорт aiogram занимает секунды — в потоке, чтобы /health отвечал уже сейчас
+        bot = await asyncio.to_thread(importlib.import_module, "bot")
+        await bot.run_polling()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    # Надёжно грузим .env рядом с app.py (локально). На Render берётся из Environment.
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+    acquire_lock()
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+# batch.py — подписи для целого альбома/папки без Telegram
+# Та же логика, что у бота (captions.caption_photo): кэш анализа, rate limiter, пул.
+#
+#   python batch.py ./photos -o captions.jsonl
+#   python batch.py manifest.jsonl -o captions.jsonl --workers 8 --kind funny
+#
+# Вход:
+# - папка: берём все картинки (jpg/jpeg/png/webp) рекурсивно, id = путь относительно папки
+# - JSONL-манифест: {"path": "...", "id": "...", "gender": "...", "length": "...", "mode": "...", "kind": "..."}
+#   (всё кроме path необязательно; относительные пути — от папки манифеста)
+#
+# Размер: фото берём как есть, без уменьшения (в боте Telegram отдаёт готовые
+# уменьшенные копии, здесь — оригиналы). Лимит --max-mb (env BATCH_MAX_PHOTO_MB,
+# по умолчанию 20 МБ — потолок OpenAI на картинку); файлы больше не отправляем,
+# а пишем строкой {"skipped": "too_large", "size": ...} — при перезапуске их
+# не повторяем, пока лимит не поднят.
+#
+# Выход: по строке JSON на фото, пишется сразу как фото готово.
+# Выходной файл — он же чекпоинт: при перезапуске уже готовые id пропускаются,
+# фото с ошибкой (сбой анализа, пустая пачка) пробуются снова. --fresh — начать с нуля.
+# Повтор дописывает новую строку, старая с error остаётся: на один id бывает
+# несколько строк, верная — последняя. --compact после прогона оставляет по одной.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import mimetypes
+from functools import partial
+from pathlib import Path
+from typing import Dict, Any, Iterator, Set, Tuple
+
+from dotenv import load_dotenv
+
+# .env — до импорта captions/media: они читают env при импорте (ANALYSIS_CACHE_SIZE, ...)
+load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+
+import captions
+import routing
+from media import DataUrlBuilder, CHUNK_SIZE
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
+SETTING_KEYS = ("gender", "length", "mode", "kind")
+MAX_PHOTO_MB = float(os.getenv("BATCH_MAX_PHOTO_MB", "20"))
+
+
+def iter_items(source: Path, defaults: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+    if source.is_dir():
+        for p in sorted(source.rglob("*")):
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTS:
+                yield {"id": str(p.relative_to(source)), "path": str(p), **defaults}
+        return
+
+    with open(source, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if "path" not in row:
+                raise ValueError(f"{source}:{n}: нет поля path")
+            path = Path(row["path"])
+            if not path.is_absolute():
+                path = source.parent / path
+            item = {"id": str(row.get("id") or row["path"]), "path": str(path), **defaults}
+            item.update({k: row[k] for k in SETTING_KEYS if row.get(k)})
+            yield item
+
+
+def load_done(output: str, max_bytes: int) -> Set[str]:
+    """
+    id, которые уже есть в выходном файле без ошибки и с подписями
+    (или помеченные unsafe — такие повторять бессмысленно).
+    Слишком большие пропускаем, только если они больше и нынешнего лимита.
+    """
+    done: Set[str] = set()
+    if output == "-" or not os.path.exists(output):
+        return done
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "id" in row and "error" not in row and (
+                row.get("captions") or row.get("unsafe") or row.get("size", 0) > max_bytes
+            ):
+                done.add(row["id"])
+    return done
+
+
+def trim_partial_line(output: str) -> None:
+    """
+    Если прошлый прогон упал посреди записи, последняя строка оборвана.
+    Обрезаем файл до последнего перевода строки, иначе следующая строка приклеится к обрывку.
+    """
+    if output == "-" or not os.path.exists(output):
+        return
+    with open(output, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(CHUNK_SIZE, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            nl = block.rfind(b"\n")
+            if nl != -1:
+                pos = pos - step + nl + 1
+                break
+            pos -= step
+        if pos != end:
+            f.truncate(pos)
+
+
+def compact(output: str) -> int:
+    """
+    Переписывает выходной файл, оставляя по id только последнюю строку
+    (порядок — по последней записи). Через временный файл: обрыв не портит выход.
+    Возвращает, сколько строк убрано.
+    """
+    rows: Dict[str, str] = {}
+    total = 0
+    with open(output, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row_id = json.loads(line)["id"]
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+            total += 1
+            rows.pop(row_id, None)
+            rows[row_id] = line if line.endswith("\n") else line + "\n"
+    tmp = output + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(rows.values())
+    os.replace(tmp, output)
+    return total - len(rows)
+
+
+def read_data_url(path: str, max_bytes: int) -> Tuple[str, str]:
+    mime = mimetypes.guess_type(path)[0] or "image/jpeg"
+    builder = DataUrlBuilder(mime, max_bytes=max_bytes, expected_size=os.path.getsize(path))
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            builder.feed(chunk)
+    return builder.finish()
+
+
+async def process(item: Dict[str, Any], max_bytes: int) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    size = os.path.getsize(item["path"])
+    if size > max_bytes:
+        return {"id": item["id"], "path": item["path"], "skipped": "too_large", "size": size}
+    sha, data_url = await asyncio.to_thread(read_data_url, item["path"], max_bytes)
+    res = await captions.caption_photo(
+        sha, data_url, item["gender"], item["length"], item["mode"], item["kind"], strict=True
+    )
+    row = {
+        "id": item["id"],
+        "path": item["path"],
+        "sha256": sha,
+        "analysis": res["analysis"],
+        "captions": res["captions"],
+        "elapsed": round(time.perf_counter() - t0, 3),
+    }
+    if res["analysis"].get("safe") == "no":
+        row["unsafe"] = True
+    return row
+
+
+async def run(args) -> int:
+    source = Path(args.source)
+    defaults = {"gender": args.gender, "length": args.length, "mode": args.mode, "kind": args.kind}
+    max_bytes = int(args.max_mb * 1024 * 1024)
+
+    if args.fresh and args.output != "-" and os.path.exists(args.output):
+        os.remove(args.output)
+    trim_partial_line(args.output)
+    done = load_done(args.output, max_bytes)
+    skipped = 0
+
+    def todo() -> Iterator[Dict[str, Any]]:
+        nonlocal skipped
+        for item in iter_items(source, defaults):
+            if item["id"] in done:
+                skipped += 1
+                continue
+            yield item
+
+    out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+    ok = failed = too_large = 0
+    t0 = time.perf_counter()
+    try:
+        work = partial(process, max_bytes=max_bytes)
+        async for item, row, err in captions.map_bounded(work, todo(), args.workers):
+            if err is not None:
+                failed += 1
+                row = {"id": item["id"], "path": item["path"], "error": f"{type(err).__name__}: {err}"}
+            elif row.get("skipped"):
+                too_large += 1
+            else:
+                ok += 1
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            done_now = ok + failed + too_large
+            if not args.quiet and done_now % 10 == 0:
+                dt = time.perf_counter() - t0
+                print(f"… {done_now} готово, {done_now / dt:.2f} items/sec", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.compact:
+        dropped = compact(args.output)
+        print(f"--compact: убрано старых строк: {dropped}", file=sys.stderr)
+
+    dt = time.perf_counter() - t0
+    rate = (ok + failed + too_large) / dt if dt > 0 else 0.0
+    print(
+        f"Готово: {ok}, ошибок: {failed}, больше {args.max_mb:g} МБ: {too_large}, "
+        f"пропущено (уже было): {skipped}, {dt:.1f} сек, {rate:.2f} items/sec",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Подписи для папки с фото или JSONL-манифеста")
+    ap.add_argument("source", help="папка с фото или manifest.jsonl")
+    ap.add_argument("-o", "--output", default="-", help="куда писать JSONL (по умолчанию stdout)")
+    ap.add_argument("--workers", type=int, default=4, help="сколько фото обрабатывать параллельно")
+    ap.add_argument("--gender", choices=["female", "male", "universal"], default="universal")
+    ap.add_argument("--length", choices=["short", "medium"], default="medium")
+    ap.add_argument("--mode", choices=["clean", "adult"], default="clean")
+    ap.add_argument("--kind", choices=["best", "funny", "beautiful", "wise", "bold"], default="best")
+    ap.add_argument("--max-mb", type=float, default=MAX_PHOTO_MB,
+                    help=f"фото больше стольких МБ не отправлять (по умолчанию {MAX_PHOTO_MB:g})")
+    ap.add_argument("--fresh", action="store_true", help="не продолжать, а перезаписать output")
+    ap.add_argument("--compact", action="store_true",
+                    help="после прогона оставить в output по одной (последней) строке на id")
+    ap.add_argument("--quiet", action="store_true", help="без промежуточного прогресса")
+    args = ap.parse_args()
+
+    if not os.path.exists(args.source):
+        ap.error(f"нет такого пути: {args.source}")
+    if args.compact and args.output == "-":
+        ap.error("--compact нужен файл в -o, а не stdout")
+    try:
+        routing.init_router()
+    except RuntimeError as e:
+        ap.error(str(e))
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
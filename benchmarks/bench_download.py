@@ -0,0 +1,146 @@
+# bench_download.py — скачивание фото: старый путь (BytesIO + read + b64) vs media.fetch_photo
+# Поднимает локальный сервер с файлами по 5 МБ и качает их N штук одновременно.
+# Каждый режим запускается в отдельном процессе, чтобы пиковый RSS не смешивался.
+#
+#   python benchmarks/bench_download.py            # оба режима, 100 фото по 5 МБ
+#   python benchmarks/bench_download.py --count 200 --size-mb 2
+
+import os
+import io
+import sys
+import time
+import base64
+import asyncio
+import argparse
+import resource
+import subprocess
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+
+import media
+
+TOKEN = "123456:BENCH"
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss в Linux — килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def start_server(payload: bytes) -> web.AppRunner:
+    async def file_handler(request):
+        resp = web.StreamResponse(headers={"Content-Length": str(len(payload))})
+        await resp.prepare(request)
+        view = memoryview(payload)
+        for i in range(0, len(payload), 256 * 1024):
+            await resp.write(view[i:i + 256 * 1024])
+        await resp.write_eof()
+        return resp
+
+    app = web.Application()
+    app.router.add_get("/file/bot{token}/{path:.*}", file_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    return runner
+
+
+class FakeBot:
+    """Минимум от aiogram.Bot, который нужен обоим путям."""
+
+    def __init__(self, port: int):
+        self.token = TOKEN
+        self.base = f"http://127.0.0.1:{port}/file/bot{{token}}/{{path}}"
+        self.session = SimpleNamespace(api=SimpleNamespace(file_url=self.file_url))
+        self.legacy_session = None
+
+    def file_url(self, token, path):
+        return self.base.format(token=token, path=path)
+
+    async def get_file(self, file_id):
+        return SimpleNamespace(file_path=f"photos/{file_id}.jpg")
+
+    async def download_file(self, file_path):
+        # как aiogram: своя сессия без лимита соединений, весь файл в BytesIO
+        if self.legacy_session is None:
+            self.legacy_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+        buf = io.BytesIO()
+        async with self.legacy_session.get(self.file_url(self.token, file_path)) as resp:
+            async for chunk in resp.content.iter_chunked(media.CHUNK_SIZE):
+                buf.write(chunk)
+        buf.seek(0)
+        return buf
+
+
+async def legacy_photo_to_data_url(bot, sizes) -> str:
+    ph = sizes[-1]
+    f = await bot.get_file(ph.file_id)
+    fb = await bot.download_file(f.file_path)
+    raw = fb.read()
+    b64 = base64.b64encode(raw).decode("utf-8")
+    return f"data:image/jpeg;base64,{b64}"
+
+
+async def stream_photo_to_data_url(bot, sizes) -> str:
+    _, data_url = await media.fetch_photo(bot, sizes)
+    return data_url
+
+
+async def run(mode: str, count: int, size_mb: float) -> None:
+    payload = os.urandom(int(size_mb * 1024 * 1024))
+    runner = await start_server(payload)
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    bot = FakeBot(port)
+    fn = legacy_photo_to_data_url if mode == "legacy" else stream_photo_to_data_url
+
+    rss_before = peak_rss_mb()
+
+    async def one(i: int) -> int:
+        sizes = [SimpleNamespace(file_id=f"f{i}", file_unique_id=f"u{i}", width=1280, height=960)]
+        return len(await fn(bot, sizes))
+
+    t0 = time.perf_counter()
+    sizes = await asyncio.gather(*(one(i) for i in range(count)))
+    dt = time.perf_counter() - t0
+
+    await media.close_session()
+    if bot.legacy_session is not None:
+        await bot.legacy_session.close()
+    await runner.cleanup()
+
+    mb = count * len(payload) / 1024 / 1024
+    print(
+        f"{mode:7s} photos={count} ok={sum(1 for s in sizes if s)} "
+        f"time={dt:.2f}s throughput={mb / dt:.1f} MB/s ({count / dt:.1f} photos/s) "
+        f"peak_rss={peak_rss_mb():.0f} MB (baseline {rss_before:.0f} MB)"
+    )
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["legacy", "stream", "both"], default="both")
+    ap.add_argument("--count", type=int, default=100)
+    ap.add_argument("--size-mb", type=float, default=5.0)
+    args = ap.parse_args()
+
+    if args.mode != "both":
+        # кэш держит data URL — в бенчмарке он только раздувает RSS
+        media.CACHE_MAX_BYTES = 0
+        asyncio.run(run(args.mode, args.count, args.size_mb))
+        return
+
+    for mode in ("legacy", "stream"):
+        subprocess.run(
+            [sys.executable, __file__, "--mode", mode,
+             "--count", str(args.count), "--size-mb", str(args.size_mb)],
+            check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
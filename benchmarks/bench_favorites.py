@@ -0,0 +1,141 @@
+# bench_favorites.py — страницы /favorites на большой таблице
+# Сравнивает старый путь (без индекса, OFFSET, COUNT(*)) и storage.py
+# (индекс (user_id, id), keyset-пагинация, счётчик в favorite_counts),
+# плюс ⭐ у пользователя с большим избранным: новая подпись и повтор.
+#
+#   python benchmarks/bench_favorites.py                 # 10M строк, ~1 мин на сборку БД
+#   python benchmarks/bench_favorites.py --rows 1000000 --db /tmp/fav.db --keep
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import storage
+
+HEAVY_USER = 1          # пользователь с большим избранным — на нём листаем глубоко
+PAGE = 10
+PAGES = (1, 10, 100, 1000)
+
+
+def build(path: str, rows: int, users: int, heavy_share: float) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("""
+    CREATE TABLE favorites (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        caption TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """)
+    rnd = random.Random(42)
+    ts = time.time()
+    batch = 100_000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO favorites (user_id, caption, created_at) VALUES (?,?,?)",
+            (
+                (HEAVY_USER if rnd.random() < heavy_share else rnd.randint(2, users),
+                 f"подпись номер {start + i}", ts)
+                for i in range(min(batch, rows - start))
+            ),
+        )
+        conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def legacy_page(page: int):
+    with storage._conn() as c:
+        return c.execute("""
+        SELECT id, caption FROM favorites NOT INDEXED
+        WHERE user_id=? ORDER BY id DESC LIMIT ? OFFSET ?
+        """, (HEAVY_USER, PAGE, (page - 1) * PAGE)).fetchall()
+
+
+def legacy_count():
+    with storage._conn() as c:
+        return c.execute(
+            "SELECT COUNT(*) FROM favorites NOT INDEXED WHERE user_id=?", (HEAVY_USER,)
+        ).fetchone()[0]
+
+
+def keyset_cursors() -> dict:
+    """before_id для начала каждой страницы из PAGES (листаем как пользователь)."""
+    cursors, before = {1: None}, None
+    for page in range(2, max(PAGES) + 1):
+        rows = storage.list_favorites(HEAVY_USER, PAGE, before)
+        if not rows:
+            break
+        before = rows[-1][0]
+        if page in PAGES:
+            cursors[page] = before
+    return cursors
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--users", type=int, default=200_000)
+    ap.add_argument("--heavy-share", type=float, default=0.01, help="доля строк у одного пользователя")
+    ap.add_argument("--db", default=None)
+    ap.add_argument("--keep", action="store_true", help="не удалять БД после прогона")
+    args = ap.parse_args()
+
+    path = args.db or os.path.join(tempfile.gettempdir(), f"bench_favorites_{args.rows}.db")
+    if not os.path.exists(path):
+        t0 = time.perf_counter()
+        build(path, args.rows, args.users, args.heavy_share)
+        print(f"built {args.rows} rows in {time.perf_counter() - t0:.1f}s -> {path}")
+
+    storage.DB_PATH = path
+    t0 = time.perf_counter()
+    storage.init_db()   # индекс + favorite_counts (один раз на старой БД)
+    print(f"init_db (index + counters): {time.perf_counter() - t0:.1f}s")
+
+    cursors = keyset_cursors()
+    total = legacy_count()
+    print(f"heavy user favorites: {total}")
+    print(f"{'page':>6} {'legacy OFFSET, ms':>18} {'keyset, ms':>11}")
+    for page in PAGES:
+        if page not in cursors:
+            continue
+        before = cursors[page]
+        legacy = timed(lambda: legacy_page(page), repeat=1)
+        keyset = timed(lambda: storage.list_favorites(HEAVY_USER, PAGE, before))
+        print(f"{page:>6} {legacy:>18.2f} {keyset:>11.3f}")
+
+    legacy = timed(legacy_count, repeat=1)
+    storage._fav_counts.clear()
+    cold = timed(lambda: storage.count_favorites(HEAVY_USER), repeat=1)
+    warm = timed(lambda: storage.count_favorites(HEAVY_USER))
+    assert storage.count_favorites(HEAVY_USER) == total
+    print(f"count: legacy COUNT(*) {legacy:.2f} ms, counter {cold:.3f} ms (cached {warm:.4f} ms)")
+
+    dup = storage.list_favorites(HEAVY_USER, 1)[0][1]
+    seq = iter(range(10 ** 9))
+    add_new = timed(lambda: storage.add_favorite(HEAVY_USER, f"новая подпись {next(seq)}"))
+    add_dup = timed(lambda: storage.add_favorite(HEAVY_USER, dup))
+    print(f"⭐ heavy user: new caption {add_new:.3f} ms, duplicate {add_dup:.3f} ms")
+
+    if not args.keep and not args.db:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
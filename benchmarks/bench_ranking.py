@@ -0,0 +1,214 @@
+# bench_ranking.py — сколько раз жмут “Другая” до подходящей подписи
+# Проигрывает сессии (фото -> пачки от модели -> нажатия “Другая”) двумя способами:
+# - legacy: как было — точные повторы внутри пачки выкинуты, порядок модели
+# - ranked: ranking.rank_captions с историей показанного пользователю
+#
+# Трафик синтетический, но с разметкой: у каждой подписи есть “смысл” (family),
+# флаги клише и неподходящей длины. Пользователь жмёт “Другая”, если подпись —
+# клише, не той длины или по смыслу уже была; иначе принимает её с вероятностью,
+# которая зависит только от смысла (одинаково для обоих способов).
+#
+#   python benchmarks/bench_ranking.py --sessions 2000
+#   python benchmarks/bench_ranking.py --save traffic.jsonl      # сохранить трафик
+#   python benchmarks/bench_ranking.py --replay traffic.jsonl    # проиграть сохранённый
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import hashlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ranking
+
+MEDIUM = [
+    "Тишина, в которой наконец слышно себя",
+    "Город спит, а я только начинаю свой день",
+    "Немного солнца в холодном городе",
+    "Кофе, плед и никаких планов на вечер",
+    "Иду туда, где тепло и никто не торопит",
+    "Этот свет хочется сохранить на всю зиму",
+    "Ветер знает больше, чем говорит",
+    "Здесь даже время идёт медленнее",
+    "Смотрю на море и ни о чём не думаю",
+    "Суббота, которую не хочется отпускать",
+    "Улыбка, которую не пришлось репетировать",
+    "Сегодня я выбираю спокойствие и длинные прогулки",
+    "Между делом поймал лучший закат недели",
+    "Там, где заканчивается асфальт, начинается отдых",
+    "Осень пришла и сразу стала моей",
+    "Никуда не спешу и это прекрасно",
+    "Тот самый вечер, ради которого стоило ждать",
+    "Шум города остался где-то позади",
+    "Простые вещи, которые делают день",
+    "Свет падает ровно так, как надо",
+]
+SHORT = [
+    "Просто хороший день",
+    "Тишина и кофе",
+    "Мой вечер",
+    "Свет на своём месте",
+    "Без спешки",
+    "Солнце в кармане",
+    "Здесь спокойно",
+    "Ветер и я",
+    "Тёплый кадр",
+    "Никуда не тороплюсь",
+]
+CLICHES = [
+    "Живи моментом, остальное подождёт",
+    "Счастье в мелочах и в этом кадре",
+    "Мечты сбываются здесь",
+    "Будь собой, это красиво",
+    "Никогда не сдавайся, даже в понедельник",
+    "Всё возможно, если очень захотеть",
+    "Внутренняя сила в каждом шаге",
+]
+# проверка фильтра клише: обычные фразы с похожими словами не должны отсеиваться
+NOT_CLICHES = [
+    "Успею всё до заката",
+    "Успела на последний поезд",
+    "Идём всем возможным маршрутам",
+    "Всё, возможно, изменится",
+    "Мечеть на закате",
+    "Сила в тишине",
+    "Живу у моря",
+    "Будь рядом",
+]
+FILLERS = ["просто", "сегодня", "немного", "снова", "опять"]
+
+
+def variant(text: str, rnd: random.Random) -> str:
+    """Почти-дубль: та же мысль с косметическими правками."""
+    words = text.split()
+    op = rnd.randint(0, 3)
+    if op == 0:
+        return text.upper() if rnd.random() < 0.3 else text + "..."
+    if op == 1 and len(words) > 3:
+        del words[rnd.randrange(1, len(words))]
+    elif op == 2:
+        words.insert(rnd.randrange(0, len(words)), rnd.choice(FILLERS))
+    else:
+        return text.replace(",", " —") + "."
+    return " ".join(words)
+
+
+def make_traffic(sessions: int, seed: int):
+    rnd = random.Random(seed)
+    out = []
+    for sid in range(sessions):
+        length = rnd.choice(["short", "medium"])
+        fit, misfit = (SHORT, MEDIUM) if length == "short" else (MEDIUM, SHORT)
+        batches, used = [], []
+        for _ in range(4):
+            batch = []
+            fresh = rnd.sample(fit, 5)
+            for f in fresh:
+                batch.append({"text": f, "family": f})
+            for f in rnd.sample(used, min(len(used), 2)):       # повтор из прошлой пачки
+                batch.append({"text": variant(f, rnd) if rnd.random() < 0.5 else f, "family": f})
+            for f in rnd.sample(fresh, 2):                       # почти-дубль внутри пачки
+                batch.append({"text": variant(f, rnd), "family": f})
+            c = rnd.choice(CLICHES)
+            batch.append({"text": c, "family": c, "cliche": True})
+            m = rnd.choice(misfit)
+            batch.append({"text": m, "family": m, "misfit": True})
+            rnd.shuffle(batch)
+            batches.append(batch[:10])
+            used += fresh
+        out.append({"session": sid, "length": length, "batches": batches})
+    return out
+
+
+def check_cliche_filter() -> None:
+    missed = [c for c in CLICHES if not ranking.has_cliche(c)]
+    false_hits = [c for c in NOT_CLICHES if ranking.has_cliche(c)]
+    assert not missed, f"клише не пойманы: {missed}"
+    assert not false_hits, f"ложные срабатывания: {false_hits}"
+
+
+def likes(session: int, family: str, p: float) -> bool:
+    h = hashlib.blake2b(f"{session}:{family}".encode(), digest_size=4).digest()
+    return int.from_bytes(h, "big") / 2 ** 32 < p
+
+
+def legacy_pipeline(batch, length, history):
+    seen, out = set(), []
+    for c in batch:
+        key = c["text"].lower()
+        if key not in seen:
+            seen.add(key)
+            out.append(c)
+    return out
+
+
+def ranked_pipeline(batch, length, history):
+    by_text = {c["text"]: c for c in batch}
+    return [by_text[t] for t in ranking.rank_captions([c["text"] for c in batch], length, history)]
+
+
+def play(session, pipeline, accept_p: float):
+    """-> (нажатий “Другая”, пачек запрошено, принял ли что-то)"""
+    history = ranking.new_history()
+    seen_families = set()
+    taps, calls = 0, 0
+    queue = []
+    batches = iter(session["batches"])
+    while True:
+        if not queue:
+            batch = next(batches, None)
+            if batch is None:
+                return taps, calls, False
+            calls += 1
+            queue = pipeline(batch, session["length"], history)
+            if not queue:
+                continue
+        c = queue.pop(0)
+        ranking.remember(history, c["text"])
+        bad = c.get("cliche") or c.get("misfit") or c["family"] in seen_families
+        seen_families.add(c["family"])
+        if not bad and likes(session["session"], c["family"], accept_p):
+            return taps, calls, True
+        taps += 1
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--accept", type=float, default=0.4, help="шанс принять хорошую подпись")
+    ap.add_argument("--save", default=None)
+    ap.add_argument("--replay", default=None)
+    args = ap.parse_args()
+
+    check_cliche_filter()
+    if args.replay:
+        with open(args.replay, encoding="utf-8") as f:
+            traffic = [json.loads(line) for line in f if line.strip()]
+    else:
+        traffic = make_traffic(args.sessions, args.seed)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            for s in traffic:
+                f.write(json.dumps(s, ensure_ascii=False) + "\n")
+
+    print(f"sessions: {len(traffic)}")
+    for name, pipeline in (("legacy", legacy_pipeline), ("ranked", ranked_pipeline)):
+        t0 = time.perf_counter()
+        res = [play(s, pipeline, args.accept) for s in traffic]
+        dt = time.perf_counter() - t0
+        n = len(res)
+        taps = sum(r[0] for r in res) / n
+        calls = sum(r[1] for r in res) / n
+        accepted = sum(1 for r in res if r[2]) / n
+        print(
+            f"{name:7s} taps/session {taps:5.2f}   batches (LLM calls)/session {calls:4.2f}   "
+            f"accepted {accepted:6.1%}   {dt / n * 1000:.2f} ms/session"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# bench_routing.py — адаптивный роутинг моделей против фиксированной модели
+# Поднимает локальный фейковый OpenAI (/v1/responses) с двумя “моделями”:
+# - slow-big:  медленная и деградирует под нагрузкой (как перегруженный тир)
+# - fast-small: быстрая и дешёвая
+# Время ответа растёт с размером пачки (N из “Сгенерируй N вариантов”).
+# Гоняет сессии “фото -> первая пачка -> 2 добора” параллельно и сравнивает
+# static (всё на slow-big x10) и adaptive (тиры + деградация по очереди/p95).
+#
+#   python benchmarks/bench_routing.py --users 40
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+
+MODELS = {
+    # model: (база, сек; за каждую подпись, сек; за каждый параллельный запрос к модели, сек)
+    "slow-big": (0.30, 0.04, 0.05),
+    "fast-small": (0.10, 0.01, 0.0),
+}
+PRICES = {"slow-big": [0.15, 0.60], "fast-small": [0.10, 0.40]}
+
+ROUTES = {
+    "static": {
+        "vision": [{"model": "slow-big", "price": PRICES["slow-big"]}],
+        "first": [{"model": "slow-big", "batch": 10, "price": PRICES["slow-big"]}],
+        "refill": [{"model": "slow-big", "batch": 10, "price": PRICES["slow-big"]}],
+    },
+    "adaptive": {
+        "vision": [{"model": "slow-big", "price": PRICES["slow-big"]}],
+        "first": [
+            {"model": "slow-big", "batch": 10, "price": PRICES["slow-big"]},
+            {"model": "slow-big", "batch": 6, "price": PRICES["slow-big"]},
+        ],
+        "refill": [
+            {"model": "slow-big", "batch": 10, "price": PRICES["slow-big"]},
+            {"model": "fast-small", "batch": 10, "price": PRICES["fast-small"]},
+            {"model": "fast-small", "batch": 5, "price": PRICES["fast-small"]},
+        ],
+    },
+}
+
+
+def fake_openai() -> web.Application:
+    active = {m: 0 for m in MODELS}
+
+    async def responses(request):
+        body = await request.json()
+        model = body["model"]
+        prompt = body["input"] if isinstance(body["input"], str) else json.dumps(body["input"])
+        m = re.search(r"Сгенерируй (\d+) вариантов", prompt)
+        n = int(m.group(1)) if m else 0
+        base, per_item, per_active = MODELS[model]
+        active[model] += 1
+        try:
+            await asyncio.sleep(base + per_item * n + per_active * active[model])
+        finally:
+            active[model] -= 1
+        if m:
+            text = json.dumps({"captions": [f"Подпись {model} номер {i}" for i in range(n)]},
+                              ensure_ascii=False)
+        else:
+            text = json.dumps({"mood": "спокойствие", "scene": "город", "vibe_tags": ["calm"], "safe": "yes"})
+        out_tokens = max(20, n * 12)
+        return web.json_response({
+            "id": "resp_bench", "object": "response", "created_at": int(time.time()),
+            "model": model, "status": "completed", "parallel_tool_calls": False,
+            "tool_choice": "auto", "tools": [],
+            "output": [{
+                "type": "message", "id": "msg_bench", "role": "assistant", "status": "completed",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "usage": {
+                "input_tokens": len(prompt) // 4, "output_tokens": out_tokens,
+                "total_tokens": len(prompt) // 4 + out_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens_details": {"reasoning_tokens": 0},
+            },
+        })
+
+    app = web.Application(client_max_size=32 * 1024 * 1024)
+    app.router.add_post("/v1/responses", responses)
+    return app
+
+
+async def run(mode: str, users: int, refills: int, depth_steps: str, p95_sec: float):
+    os.environ["MODEL_ROUTES"] = json.dumps(ROUTES[mode])
+    os.environ["ROUTE_DEPTH_STEPS"] = depth_steps
+    os.environ["ROUTE_P95_SEC"] = str(p95_sec)
+
+    import routing
+    import captions
+
+    routing._router = None   # перечитать env для этого режима
+    router = routing.get_router()
+    lat = {"vision": [], "first": [], "refill": []}
+
+    async def timed(stage, fn, *args):
+        t0 = time.perf_counter()
+        res = await asyncio.to_thread(fn, *args)
+        lat[stage].append(time.perf_counter() - t0)
+        return res
+
+    async def session(i: int):
+        await asyncio.sleep(i * 0.02)   # пользователи приходят не все в одну миллисекунду
+        analysis = await timed("vision", captions.analyze_image, "data:image/jpeg;base64,AAAA")
+        await timed("first", captions.generate_batch, analysis, "universal", "medium", "clean", "best", "first")
+        for _ in range(refills):
+            await timed("refill", captions.generate_batch, analysis, "universal", "medium", "clean", "best", "refill")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(users)))
+    wall = time.perf_counter() - t0
+
+    print(f"\n== {mode}: {users} users, wall {wall:.2f}s")
+    for stage, xs in lat.items():
+        xs.sort()
+        p95 = xs[min(len(xs) - 1, int(len(xs) * 0.95))]
+        print(f"  {stage:7s} calls {len(xs):4d}  p50 {statistics.median(xs):5.2f}s  p95 {p95:5.2f}s")
+    total = 0.0
+    for name, t in router.stats()["tiers"].items():
+        if t["calls"]:
+            total += t["cost_usd"]
+            print(f"  {name:34s} calls {t['calls']:4d}  p95 {t['p95_sec']}s  cost ${t['cost_usd']:.6f}")
+    print(f"  total cost ${total:.6f}")
+
+
+async def main_async(args):
+    runner = web.AppRunner(fake_openai())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ["OPENAI_RPM"] = "100000"
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.users * 2))
+
+    try:
+        for mode in ("static", "adaptive"):
+            await run(mode, args.users, args.refills, args.depth_steps, args.p95_sec)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=40)
+    ap.add_argument("--refills", type=int, default=2)
+    ap.add_argument("--depth-steps", default="8,16")
+    ap.add_argument("--p95-sec", type=float, default=1.5)
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
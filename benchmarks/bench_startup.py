@@ -0,0 +1,81 @@
+# bench_startup.py — холодный старт: время импорта и time-to-healthy
+# - import: сколько стоит `import app` / `import bot` в чистом процессе
+# - ready: import bot + create_app() (Bot, Dispatcher) — то, что раньше было до /health
+# - healthy: от запуска `python app.py` до первого 200 на /health
+#
+#   python benchmarks/bench_startup.py --runs 10
+
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import tempfile
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENV = {
+    **os.environ,
+    "BOT_TOKEN": "123456:BENCH",
+    "OPENAI_API_KEY": "sk-bench",
+    "LOCK_FILE": os.path.join(tempfile.gettempdir(), "quote_bot_bench.lock"),
+}
+
+
+def run_snippet(code: str) -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", f"import time; t0 = time.perf_counter(); {code}; "
+                               f"print(time.perf_counter() - t0)"],
+        cwd=ROOT, env=ENV, capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_healthy(timeout: float = 20.0) -> float:
+    port = free_port()
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "app.py"], cwd=ROOT, env={**ENV, "PORT": str(port)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - t0 < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=0.5) as r:
+                    if r.status == 200:
+                        return (time.perf_counter() - t0) * 1000
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError("health не ответил")
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+def report(name: str, samples):
+    print(f"{name:32s} median {statistics.median(samples):7.1f} ms   min {min(samples):7.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    report("import app", [run_snippet("import app") for _ in range(args.runs)])
+    report("import bot", [run_snippet("import bot") for _ in range(args.runs)])
+    report("import bot + create_app()",
+           [run_snippet("import bot; bot.create_app()") for _ in range(args.runs)])
+    report("python app.py -> /health 200", [time_to_healthy() for _ in range(args.runs)])
+
+
+if __name__ == "__main__":
+    main()
@@ -6,57 +6,41 @@
 # - “думаю…” сообщение
 # - пачка вариантов (топ + запас) и кнопка “Другая”
 # - дневной лимит + антиспам
-# - health web-server для Render (/ и /health)
-# - защита от конфликтов polling (лок-файл lock) — чтобы не было TelegramConflictError
+# - ⭐ избранное и /favorites, история показанных подписей /history (постранично, storage.py)
+# - альбомы (media group) — одной пачкой через общий пул, как batch.py
+# - без побочных эффектов при импорте: Bot/Dispatcher создаёт create_app(),
+#   health-сервер и лок — в app.py (точка входа)
 
 import os
-import sys
-import json
-import base64
 import random
 import time
-import fcntl
+import asyncio
 from pathlib import Path
-from typing import Dict, Any, Tuple, List
+from typing import Dict, Any, Tuple, List, Optional
 
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher, F
+from aiogram import Bot, Dispatcher, Router, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import CommandStart
+from aiogram.filters import CommandStart, Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from aiohttp import web
-from openai import OpenAI
-
 from quotes import QUOTES
-
-# ====== LOCK (анти-конфликт polling) ======
-LOCK_FILE = "/tmp/quote_bot.lock"
-_lock_fd = open(LOCK_FILE, "w")
-try:
-    fcntl.flock(_lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
-except BlockingIOError:
-    print("Another instance is already running. Exiting.")
-    sys.exit(0)
+from captions import generate_batch
+import captions
+import media
+import ranking
+import routing
+import storage
 
 # ===== настройки лимитов =====
 DAILY_LIMIT = 20       # 20 генераций в день
 COOLDOWN_SEC = 3.0     # не чаще 1 генерации в 3 секунды
+ALBUM_WAIT_SEC = 1.0   # сколько ждём остальные фото альбома
+ALBUM_WORKERS = 4      # сколько фото альбома обрабатываем параллельно
+FAV_PAGE_SIZE = 10     # подписей на странице /favorites
 
-# Надёжно грузим .env рядом с bot.py (локально). На Render берётся из Environment.
-load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
-
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not BOT_TOKEN:
-    raise RuntimeError("Нет BOT_TOKEN (добавь в .env или Render Environment)")
-if not OPENAI_API_KEY:
-    raise RuntimeError("Нет OPENAI_API_KEY (добавь в .env или Render Environment)")
-
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
-client = OpenAI(api_key=OPENAI_API_KEY)
+# хэндлеры вешаем на Router — его можно импортировать без токенов (тесты, бенчмарки)
+router = Router()
 
 # user_state[user_id] = {
 #   "gender": "female|male|universal",
@@ -66,13 +50,18 @@ client = OpenAI(api_key=OPENAI_API_KEY)
 #   "kind": "best|funny|beautiful|wise|bold",
 #   "analysis": dict|None,
 #   "last_batch": list[str],   # очередь готовых подписей
+#   "batches": int,            # сколько пачек уже сгенерили под это фото (0 -> стадия first)
 #   "used_quotes": set(),
+#   "history": deque,          # MinHash показанных подписей (ranking.py)
 #   "quota_day": "YYYY-MM-DD",
 #   "quota_used": int,
 #   "last_req_ts": float,
 # }
 user_state: Dict[int, Dict[str, Any]] = {}
 
+# _albums[media_group_id] = [Message, ...] — копим фото альбома, пока они приходят
+_albums: Dict[str, List[Message]] = {}
+
 
 # ===== util =====
 def today_str() -> str:
@@ -89,7 +78,9 @@ def st(uid: int) -> Dict[str, Any]:
             "kind": "best",
             "analysis": None,
             "last_batch": [],
+            "batches": 0,
             "used_quotes": set(),
+            "history": ranking.new_history(),
             "quota_day": today_str(),
             "quota_used": 0,
             "last_req_ts": 0.0,
@@ -164,11 +155,14 @@ def kind_kb():
     return kb.as_markup()
 
 
-def actions_kb(uid: int):
+def actions_kb(uid: int, fav: bool = True):
+    # fav=False — для ответа на альбом: там список подписей, ⭐ сохранил бы его целиком
     left = quota_left(uid)
     kb = InlineKeyboardBuilder()
 
     kb.button(text=f"🔄 Другая (осталось {left})", callback_data="gen:next")
+    if fav:
+        kb.button(text="⭐", callback_data="fav:add")
 
     kb.button(text="😂", callback_data="kind:funny")
     kb.button(text="✨", callback_data="kind:beautiful")
@@ -182,7 +176,13 @@ def actions_kb(uid: int):
     kb.button(text="🎭 Стиль", callback_data="nav:gender")
     kb.button(text="🧼/😈 Режим", callback_data="nav:mode")
 
-    kb.adjust(1, 5, 2, 2)
+    kb.adjust(2 if fav else 1, 5, 2, 2)
+    return kb.as_markup()
+
+
+def page_kb(prefix: str, before_id: int, shown: int):
+    kb = InlineKeyboardBuilder()
+    kb.button(text="Дальше ▶", callback_data=f"{prefix}:page:{before_id}:{shown}")
     return kb.as_markup()
 
 
@@ -199,183 +199,52 @@ def pick_fallback(uid: int) -> str:
     return q
 
 
-# ===== image -> data url =====
-async def photo_to_data_url(message: Message) -> str:
-    ph = message.photo[-1]
-    f = await bot.get_file(ph.file_id)
-    fb = await bot.download_file(f.file_path)
-    raw = fb.read()
-    b64 = base64.b64encode(raw).decode("utf-8")
-    return f"data:image/jpeg;base64,{b64}"
-
-
-# ===== OpenAI calls =====
-def analyze_image(image_data_url: str) -> Dict[str, Any]:
-    """
-    Достаём вайб максимально полезно для подписи.
-    Возвращаем JSON.
-    """
-    prompt = (
-        "Проанализируй фото для подбора подписи в соцсети. Верни строго JSON без лишнего текста.\n"
-        "{"
-        "\"mood\":\"...\","
-        "\"persona\":\"...\","
-        "\"scene\":\"...\","
-        "\"style\":\"...\","
-        "\"colors\":\"...\","
-        "\"vibe_tags\":[\"...\",\"...\",\"...\"],"
-        "\"safe\":\"yes|no\""
-        "}\n"
-        "mood: 1-3 слова (например: спокойствие/ирония/романтика/драйв/задумчивость)\n"
-        "persona: какое впечатление производит человек (например: уверенный интроверт/мягкий романтик/ироничный)\n"
-        "scene: что за место/ситуация\n"
-        "style: эстетика/одежда/настроение кадра\n"
-        "safe='no' если изображение явно неприемлемое."
-    )
-    r = client.responses.create(
-        model="gpt-4o-mini",
-        input=[{
-            "role": "user",
-            "content": [
-                {"type": "input_text", "text": prompt},
-                {"type": "input_image", "image_url": image_data_url},
-            ],
-        }],
-        max_output_tokens=260,
-    )
-    t = r.output_text.strip()
+def mark_served(uid: int, cap: str) -> None:
+    # показанная подпись: в MinHash-историю для ранжирования и в /history
+    ranking.remember(st(uid)["history"], cap)
     try:
-        return json.loads(t)
-    except json.JSONDecodeError:
-        return {
-            "mood": "спокойствие",
-            "persona": "естественный вайб",
-            "scene": "фото",
-            "style": "минимализм",
-            "colors": "нейтрально",
-            "vibe_tags": ["aesthetic", "calm"],
-            "safe": "yes",
-        }
-
-
-def generate_batch(analysis: Dict[str, Any], gender: str, length: str, mode: str, kind: str) -> List[str]:
-    """
-    Генерирует пачку вариантов и возвращает список строк (уже отфильтрованных).
-    Мы будем показывать по одной, а “Другая” — следующую из очереди.
-    """
-    gender_style = {
-        "female": "Женский стиль: эстетично, мягко, уверенно.",
-        "male": "Мужской стиль: сдержанно, уверенно, можно чуть дерзко.",
-        "universal": "Универсально: подходит всем, красиво и естественно."
-    }[gender]
-
-    len_style = "Очень коротко (2–6 слов)." if length == "short" else "Средняя длина (1–2 строки)."
-
-    kind_style = {
-        "best": "Максимально точно в вайб фото, звучит естественно, современно.",
-        "funny": "Смешно и умно, лёгкая ирония, без кринжа.",
-        "beautiful": "Очень красиво и эстетично, как идеальная подпись к фото.",
-        "wise": "Мудро и глубоко, но без банальных мотивашек и пафоса.",
-        "bold": "Дерзко и уверенно, но без токсичности и грубости.",
-    }.get(kind, "Максимально точно в вайб фото, естественно.")
-
-    if mode == "adult":
-        tone = (
-            "Разрешён мат (18+), но: без травли, без унижения групп людей, без угроз, "
-            "без призывов к насилию, без сексуального контента."
-        )
-    else:
-        tone = "Строго без мата и без грубых оскорблений."
-
-    # Запрещаем кринж-клише
-    banned = (
-        "Запрещённые клише (не использовать): мечты, успех, будь собой, никогда не сдавайся, "
-        "живи моментом, всё возможно, счастье в мелочах, внутренняя сила."
-    )
-
-    prompt = (
-        "Ты — топовый автор подписей к фото на русском языке.\n"
-        "Сделай так, будто ты на одном вайбе с человеком на фото.\n\n"
-        f"{gender_style}\n"
-        f"Тип: {kind_style}\n"
-        f"Длина: {len_style}\n"
-        f"Ограничения: {tone}\n"
-        f"{banned}\n\n"
-        "Задача: Сгенерируй 10 вариантов подписей (все разные), строго на русском.\n"
-        "Правила:\n"
-        "- без эмодзи\n"
-        "- без кавычек\n"
-        "- без хэштегов\n"
-        "- не оценивать внешность\n"
-        "- избегать пафоса и банальностей\n\n"
-        "Контекст фото:\n"
-        f"mood: {analysis.get('mood')}\n"
-        f"persona: {analysis.get('persona')}\n"
-        f"scene: {analysis.get('scene')}\n"
-        f"style: {analysis.get('style')}\n"
-        f"colors: {analysis.get('colors')}\n"
-        f"tags: {', '.join(analysis.get('vibe_tags', []))}\n\n"
-        "Верни строго JSON формата:\n"
-        "{ \"captions\": [\"...\", \"...\", \"...\"] }\n"
-    )
-
-    r = client.responses.create(
-        model="gpt-4o-mini",
-        input=prompt,
-        max_output_tokens=280 if length == "short" else 420,
-    )
-    txt = r.output_text.strip()
-    try:
-        data = json.loads(txt)
-        captions = data.get("captions", [])
-        # чистим и фильтруем пустое/повторы
-        clean = []
-        seen = set()
-        for c in captions:
-            if not isinstance(c, str):
-                continue
-            c = c.strip().strip('"').strip()
-            if not c:
-                continue
-            key = c.lower()
-            if key in seen:
-                continue
-            seen.add(key)
-            clean.append(c)
-        return clean[:10] if clean else []
+        storage.add_history(uid, cap)
     except Exception:
-        return []
+        pass
 
 
 def pop_or_generate(uid: int) -> str:
     """
     Берём следующую подпись из очереди пользователя.
-    Если очереди нет — генерим новую пачку.
+    Если очереди нет — генерим новую пачку, чистим её от клише и повторов
+    (в т.ч. уже показанного раньше) и ставим лучшие варианты вперёд.
     """
     s = st(uid)
     if s.get("last_batch"):
-        return s["last_batch"].pop(0)
+        cap = s["last_batch"].pop(0)
+        mark_served(uid, cap)
+        return cap
 
     analysis = s.get("analysis")
     if not analysis:
         return pick_fallback(uid)
 
     try:
-        batch = generate_batch(analysis, s["gender"], s["length"], s["mode"], s["kind"])
+        stage = "refill" if s.get("batches") else "first"
+        batch = generate_batch(analysis, s["gender"], s["length"], s["mode"], s["kind"], stage)
+        s["batches"] = s.get("batches", 0) + 1
+        batch = ranking.rank_captions(batch, s["length"], s["history"])
         if not batch:
             return pick_fallback(uid)
         s["last_batch"] = batch[1:]  # оставляем запас
+        mark_served(uid, batch[0])
         return batch[0]
     except Exception:
         return pick_fallback(uid)
 
 
 # ===== handlers =====
-@dp.message(CommandStart())
+@router.message(CommandStart())
 async def start(message: Message):
     s = st(message.from_user.id)
     s["analysis"] = None
     s["last_batch"] = []
+    s["batches"] = 0
     await message.answer(
         "Привет! Я делаю подписи под фото (на русском).\n\n"
         "Шаг 1: выбери стиль:",
@@ -383,7 +252,7 @@ async def start(message: Message):
     )
 
 
-@dp.callback_query(F.data.startswith("gender:"))
+@router.callback_query(F.data.startswith("gender:"))
 async def on_gender(c: CallbackQuery):
     uid = c.from_user.id
     st(uid)["gender"] = c.data.split(":", 1)[1]
@@ -391,7 +260,7 @@ async def on_gender(c: CallbackQuery):
     await c.message.answer("Шаг 2: выбери режим:", reply_markup=mode_kb())
 
 
-@dp.callback_query(F.data.startswith("mode:"))
+@router.callback_query(F.data.startswith("mode:"))
 async def on_mode(c: CallbackQuery):
     uid = c.from_user.id
     mode = c.data.split(":", 1)[1]
@@ -405,7 +274,7 @@ async def on_mode(c: CallbackQuery):
         await c.message.answer("18+ подтверждаешь?", reply_markup=adult_confirm_kb())
 
 
-@dp.callback_query(F.data.startswith("adult:"))
+@router.callback_query(F.data.startswith("adult:"))
 async def on_adult_confirm(c: CallbackQuery):
     uid = c.from_user.id
     ans = c.data.split(":", 1)[1]
@@ -421,20 +290,22 @@ async def on_adult_confirm(c: CallbackQuery):
         await c.message.answer("Шаг 3: какой тип подписи хочешь?", reply_markup=kind_kb())
 
 
-@dp.callback_query(F.data.startswith("kind:"))
+@router.callback_query(F.data.startswith("kind:"))
 async def on_kind(c: CallbackQuery):
     uid = c.from_user.id
     st(uid)["kind"] = c.data.split(":", 1)[1]
     st(uid)["last_batch"] = []  # сбрасываем очередь, чтобы новый стиль реально применился
+    st(uid)["batches"] = 0      # и следующая пачка снова стадии first, а не refill
     await c.answer("Ок")
     await c.message.answer("Шаг 4: отправь фото 📸")
 
 
-@dp.callback_query(F.data.startswith("len:"))
+@router.callback_query(F.data.startswith("len:"))
 async def on_len(c: CallbackQuery):
     uid = c.from_user.id
     st(uid)["length"] = c.data.split(":", 1)[1]
     st(uid)["last_batch"] = []
+    st(uid)["batches"] = 0      # пересобранная пачка — снова first: человек ждёт её сейчас
     await c.answer("Ок")
 
     # если уже было фото — пересоберём подпись под новый формат
@@ -447,7 +318,7 @@ async def on_len(c: CallbackQuery):
         wait_msg = await c.message.answer("⏳ Подбираю подпись под фото...")
         try:
             mark_request(uid)
-            cap = pop_or_generate(uid)
+            cap = await asyncio.to_thread(pop_or_generate, uid)
         except Exception:
             cap = pick_fallback(uid)
 
@@ -459,20 +330,24 @@ async def on_len(c: CallbackQuery):
         await c.message.answer(cap, reply_markup=actions_kb(uid))
 
 
-@dp.callback_query(F.data == "nav:gender")
+@router.callback_query(F.data == "nav:gender")
 async def nav_gender(c: CallbackQuery):
     await c.answer()
     await c.message.answer("Выбери стиль:", reply_markup=gender_kb())
 
 
-@dp.callback_query(F.data == "nav:mode")
+@router.callback_query(F.data == "nav:mode")
 async def nav_mode(c: CallbackQuery):
     await c.answer()
     await c.message.answer("Выбери режим:", reply_markup=mode_kb())
 
 
-@dp.message(F.photo)
+@router.message(F.photo)
 async def on_photo(m: Message):
+    if m.media_group_id:
+        await on_album(m)
+        return
+
     uid = m.from_user.id
     s = st(uid)
 
@@ -484,23 +359,12 @@ async def on_photo(m: Message):
     wait_msg = await m.answer("⏳ Подбираю подпись под фото...")
 
     try:
-        data_url = await photo_to_data_url(m)
-
-        try:
-            analysis = analyze_image(data_url)
-        except Exception:
-            analysis = {
-                "mood": "спокойствие",
-                "persona": "естественный вайб",
-                "scene": "фото",
-                "style": "минимализм",
-                "colors": "нейтрально",
-                "vibe_tags": ["aesthetic", "calm"],
-                "safe": "yes",
-            }
+        sha, data_url = await media.fetch_photo(m.bot, m.photo)
+        analysis = await captions.analyze_photo(sha, data_url)
 
         s["analysis"] = analysis
         s["last_batch"] = []
+        s["batches"] = 0
 
         if analysis.get("safe") == "no":
             try:
@@ -512,7 +376,7 @@ async def on_photo(m: Message):
 
         try:
             mark_request(uid)
-            cap = pop_or_generate(uid)
+            cap = await asyncio.to_thread(pop_or_generate, uid)
         except Exception:
             cap = pick_fallback(uid)
 
@@ -531,7 +395,71 @@ async def on_photo(m: Message):
         await m.answer(pick_fallback(uid), reply_markup=actions_kb(uid))
 
 
-@dp.callback_query(F.data == "gen:next")
+async def on_album(m: Message):
+    """
+    Фото альбома приходят отдельными сообщениями с одним media_group_id.
+    Первое сообщение ждёт остальные, потом весь альбом идёт одной пачкой
+    через тот же пул, что и batch.py: по подписи на фото, одним ответом.
+    """
+    group = _albums.setdefault(m.media_group_id, [])
+    group.append(m)
+    if len(group) > 1:
+        return
+    await asyncio.sleep(ALBUM_WAIT_SEC)
+    messages = sorted(_albums.pop(m.media_group_id, []), key=lambda x: x.message_id)
+
+    uid = m.from_user.id
+    s = st(uid)
+
+    ok, msg = can_request(uid)
+    if not ok:
+        await m.answer(msg)
+        return
+
+    photos = messages[:quota_left(uid)]
+    wait_msg = await m.answer(f"⏳ Подбираю подписи для {len(photos)} фото...")
+
+    async def one(pm: Message) -> Dict[str, Any]:
+        sha, data_url = await media.fetch_photo(pm.bot, pm.photo)
+        return await captions.caption_photo(
+            sha, data_url, s["gender"], s["length"], s["mode"], s["kind"], s["history"]
+        )
+
+    results: Dict[int, Any] = {}
+    async for pm, res, err in captions.map_bounded(one, photos, ALBUM_WORKERS):
+        mark_request(uid)
+        results[pm.message_id] = None if err else res
+
+    lines = []
+    last = None
+    for i, pm in enumerate(photos, 1):
+        res = results.get(pm.message_id)
+        if res and res["analysis"].get("safe") == "no":
+            cap = "Не могу сделать подпись для этого фото."
+        elif res and res["captions"]:
+            cap = res["captions"][0]
+            await asyncio.to_thread(mark_served, uid, cap)
+            last = res
+        else:
+            cap = pick_fallback(uid)
+        lines.append(f"{i}. {cap}")
+    if len(messages) > len(photos):
+        lines.append(f"Ещё {len(messages) - len(photos)} фото не влезли в дневной лимит.")
+
+    # “Другая” дальше работает по последнему фото альбома
+    s["analysis"] = last["analysis"] if last else None
+    s["last_batch"] = last["captions"][1:] if last else []
+    s["batches"] = 1 if last else 0
+
+    try:
+        await wait_msg.delete()
+    except Exception:
+        pass
+
+    await m.answer("\n\n".join(lines), reply_markup=actions_kb(uid, fav=False))
+
+
+@router.callback_query(F.data == "gen:next")
 async def gen_next(c: CallbackQuery):
     uid = c.from_user.id
     s = st(uid)
@@ -550,7 +478,7 @@ async def gen_next(c: CallbackQuery):
 
     try:
         mark_request(uid)
-        cap = pop_or_generate(uid)
+        cap = await asyncio.to_thread(pop_or_generate, uid)
     except Exception:
         cap = pick_fallback(uid)
 
@@ -562,36 +490,108 @@ async def gen_next(c: CallbackQuery):
     await c.message.answer(cap, reply_markup=actions_kb(uid))
 
 
-@dp.message()
-async def other(m: Message):
-    await m.answer("Отправь фото 📸 или нажми /start")
+# ===== favorites / history =====
+def render_page(prefix: str, title: str, rows: List[Tuple[int, str]], shown: int, has_more: bool) -> Tuple[str, Any]:
+    lines = [title, ""]
+    for i, (_, cap) in enumerate(rows, shown + 1):
+        lines.append(f"{i}. {cap}")
+    shown += len(rows)
+    kb = page_kb(prefix, rows[-1][0], shown) if has_more else None
+    return "\n".join(lines), kb
 
 
-# ===== Web server for Render =====
-async def start_web_server():
-    app = web.Application()
+def favorites_page(uid: int, before_id: Optional[int] = None, shown: int = 0) -> Tuple[str, Any]:
+    total = storage.count_favorites(uid)
+    rows = storage.list_favorites(uid, FAV_PAGE_SIZE, before_id)
+    if not rows:
+        return "В избранном пока пусто. Нажми ⭐ под подписью, чтобы сохранить её.", None
+    return render_page("fav", f"⭐ Избранное ({total}):", rows, shown, shown + len(rows) < total)
 
-    async def health(request):
-        return web.Response(text="OK")
 
-    app.router.add_get("/", health)
-    app.router.add_get("/health", health)
+def history_page(uid: int, before_id: Optional[int] = None, shown: int = 0) -> Tuple[str, Any]:
+    # на 1 больше страницы — чтобы знать, есть ли следующая, без COUNT(*)
+    rows = storage.list_history(uid, FAV_PAGE_SIZE + 1, before_id)
+    if not rows:
+        return "История пока пустая. Отправь фото 📸", None
+    has_more = len(rows) > FAV_PAGE_SIZE
+    return render_page("hist", "🕘 Недавние подписи:", rows[:FAV_PAGE_SIZE], shown, has_more)
 
-    runner = web.AppRunner(app)
-    await runner.setup()
 
-    port = int(os.getenv("PORT", "10000"))
-    site = web.TCPSite(runner, host="0.0.0.0", port=port)
-    await site.start()
+@router.callback_query(F.data == "fav:add")
+async def fav_add(c: CallbackQuery):
+    cap = (c.message.text or "").strip() if c.message else ""
+    if not cap:
+        await c.answer()
+        return
+    if await asyncio.to_thread(storage.add_favorite, c.from_user.id, cap):
+        await c.answer("Сохранено в избранное ⭐")
+    else:
+        await c.answer("Уже в избранном")
+
 
-    print(f"✅ Web server started on 0.0.0.0:{port}")
+@router.message(Command("favorites"))
+async def favorites(m: Message):
+    text, kb = await asyncio.to_thread(favorites_page, m.from_user.id)
+    await m.answer(text, reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("fav:page:"))
+async def favorites_next(c: CallbackQuery):
+    _, _, before_id, shown = c.data.split(":")
+    text, kb = await asyncio.to_thread(favorites_page, c.from_user.id, int(before_id), int(shown))
+    await c.answer()
+    await c.message.answer(text, reply_markup=kb)
+
+
+@router.message(Command("history"))
+async def history(m: Message):
+    text, kb = await asyncio.to_thread(history_page, m.from_user.id)
+    await m.answer(text, reply_markup=kb)
+
+
+@router.callback_query(F.data.startswith("hist:page:"))
+async def history_next(c: CallbackQuery):
+    _, _, before_id, shown = c.data.split(":")
+    text, kb = await asyncio.to_thread(history_page, c.from_user.id, int(before_id), int(shown))
+    await c.answer()
+    await c.message.answer(text, reply_markup=kb)
 
 
-async def main():
-    await start_web_server()
-    await dp.start_polling(bot)
+@router.message()
+async def other(m: Message):
+    await m.answer("Отправь фото 📸 или нажми /start")
+
+
+# ===== app factory =====
+def create_app() -> Tuple[Bot, Dispatcher]:
+    # app.main() уже загрузил .env до импортов; здесь — для запуска create_app() напрямую
+    load_dotenv(dotenv_path=Path(__file__).with_name(".env"))
+
+    bot_token = os.getenv("BOT_TOKEN")
+    if not bot_token:
+        raise RuntimeError("Нет BOT_TOKEN (добавь в .env или Render Environment)")
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("Нет OPENAI_API_KEY (добавь в .env или Render Environment)")
+
+    routing.init_router()   # ошибка в MODEL_ROUTES — падаем на старте, а не в каждом хэндлере
+
+    bot = Bot(token=bot_token)
+    dp = Dispatcher()
+    dp.include_router(router)
+    return bot, dp
+
+
+async def run_polling():
+    # миграция на большой базе идёт минутами — в потоке, чтобы /health отвечал
+    await asyncio.to_thread(storage.init_db)
+    bot, dp = create_app()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await media.close_session()
+        await bot.session.close()
 
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
+    import app
+    app.main()
@@ -0,0 +1,317 @@
+# captions.py — работа с OpenAI: анализ фото и генерация подписей
+# Общий код для бота и batch-режима (batch.py), без побочных эффектов при импорте:
+# - клиент OpenAI создаётся лениво при первом запросе
+# - общий rate limiter на все вызовы (OPENAI_RPM)
+# - модель и размер пачки выбирает routing.py (по стадии и нагрузке)
+# - кэш анализа по sha256 фото: одно и то же фото не анализируем дважды
+# - map_bounded: пул из N воркеров, результаты отдаются по мере готовности
+
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple, Deque, Callable, Awaitable, Iterable, AsyncIterator
+
+import ranking
+from routing import get_router
+
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+
+                api_key = os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Нет OPENAI_API_KEY (добавь в .env или Render Environment)")
+                _client = OpenAI(api_key=api_key)
+    return _client
+
+
+class RateLimiter:
+    """
+    Token bucket: не больше rpm запросов в минуту, с запасом на короткий всплеск.
+    Блокирующий — вызывается из потоков (asyncio.to_thread), не из event loop.
+    """
+
+    def __init__(self, rpm: int, burst: Optional[int] = None):
+        self.rate = rpm / 60.0
+        self.capacity = float(burst or max(1, rpm // 10))
+        self.tokens = self.capacity
+        self.ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+                self.ts = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _client_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(int(os.getenv("OPENAI_RPM", "300")))   # запросов в минуту на процесс
+    return _limiter
+
+
+def fallback_analysis() -> Dict[str, Any]:
+    return {
+        "mood": "спокойствие",
+        "persona": "естественный вайб",
+        "scene": "фото",
+        "style": "минимализм",
+        "colors": "нейтрально",
+        "vibe_tags": ["aesthetic", "calm"],
+        "safe": "yes",
+    }
+
+
+def analyze_image(image_data_url: str) -> Dict[str, Any]:
+    """
+    Достаём вайб максимально полезно для подписи.
+    Возвращаем JSON.
+    """
+    prompt = (
+        "Проанализируй фото для подбора подписи в соцсети. Верни строго JSON без лишнего текста.\n"
+        "{"
+        "\"mood\":\"...\","
+        "\"persona\":\"...\","
+        "\"scene\":\"...\","
+        "\"style\":\"...\","
+        "\"colors\":\"...\","
+        "\"vibe_tags\":[\"...\",\"...\",\"...\"],"
+        "\"safe\":\"yes|no\""
+        "}\n"
+        "mood: 1-3 слова (например: спокойствие/ирония/романтика/драйв/задумчивость)\n"
+        "persona: какое впечатление производит человек (например: уверенный интроверт/мягкий романтик/ироничный)\n"
+        "scene: что за место/ситуация\n"
+        "style: эстетика/одежда/настроение кадра\n"
+        "safe='no' если изображение явно неприемлемое."
+    )
+    with get_router().call("vision") as call:
+        get_limiter().acquire()
+        call.start()
+        r = get_client().responses.create(
+            model=call.tier.model,
+            input=[{
+                "role": "user",
+                "content": [
+                    {"type": "input_text", "text": prompt},
+                    {"type": "input_image", "image_url": image_data_url},
+                ],
+            }],
+            max_output_tokens=260,
+        )
+        call.done(r)
+    t = r.output_text.strip()
+    try:
+        return json.loads(t)
+    except json.JSONDecodeError:
+        return fallback_analysis()
+
+
+def generate_batch(analysis: Dict[str, Any], gender: str, length: str, mode: str, kind: str,
+                   stage: str = "first") -> List[str]:
+    """
+    Генерирует пачку вариантов и возвращает список строк (уже отфильтрованных).
+    Мы будем показывать по одной, а “Другая” — следующую из очереди.
+    stage: "first" — первая пачка после фото, "refill" — добор по “Другая” (routing.py).
+    """
+    call = get_router().call(stage)
+    n = call.tier.batch
+
+    gender_style = {
+        "female": "Женский стиль: эстетично, мягко, уверенно.",
+        "male": "Мужской стиль: сдержанно, уверенно, можно чуть дерзко.",
+        "universal": "Универсально: подходит всем, красиво и естественно."
+    }[gender]
+
+    len_style = "Очень коротко (2–6 слов)." if length == "short" else "Средняя длина (1–2 строки)."
+
+    kind_style = {
+        "best": "Максимально точно в вайб фото, звучит естественно, современно.",
+        "funny": "Смешно и умно, лёгкая ирония, без кринжа.",
+        "beautiful": "Очень красиво и эстетично, как идеальная подпись к фото.",
+        "wise": "Мудро и глубоко, но без банальных мотивашек и пафоса.",
+        "bold": "Дерзко и уверенно, но без токсичности и грубости.",
+    }.get(kind, "Максимально точно в вайб фото, естественно.")
+
+    if mode == "adult":
+        tone = (
+            "Разрешён мат (18+), но: без травли, без унижения групп людей, без угроз, "
+            "без призывов к насилию, без сексуального контента."
+        )
+    else:
+        tone = "Строго без мата и без грубых оскорблений."
+
+    # Запрещаем кринж-клише
+    banned = f"Запрещённые клише (не использовать): {', '.join(ranking.BANNED_CLICHES)}."
+
+    prompt = (
+        "Ты — топовый автор подписей к фото на русском языке.\n"
+        "Сделай так, будто ты на одном вайбе с человеком на фото.\n\n"
+        f"{gender_style}\n"
+        f"Тип: {kind_style}\n"
+        f"Длина: {len_style}\n"
+        f"Ограничения: {tone}\n"
+        f"{banned}\n\n"
+        f"Задача: Сгенерируй {n} вариантов подписей (все разные), строго на русском.\n"
+        "Правила:\n"
+        "- без эмодзи\n"
+        "- без кавычек\n"
+        "- без хэштегов\n"
+        "- не оценивать внешность\n"
+        "- избегать пафоса и банальностей\n\n"
+        "Контекст фото:\n"
+        f"mood: {analysis.get('mood')}\n"
+        f"persona: {analysis.get('persona')}\n"
+        f"scene: {analysis.get('scene')}\n"
+        f"style: {analysis.get('style')}\n"
+        f"colors: {analysis.get('colors')}\n"
+        f"tags: {', '.join(analysis.get('vibe_tags', []))}\n\n"
+        "Верни строго JSON формата:\n"
+        "{ \"captions\": [\"...\", \"...\", \"...\"] }\n"
+    )
+
+    with call:
+        get_limiter().acquire()
+        call.start()
+        r = get_client().responses.create(
+            model=call.tier.model,
+            input=prompt,
+            max_output_tokens=280 if length == "short" else 420,
+        )
+        call.done(r)
+    txt = r.output_text.strip()
+    try:
+        data = json.loads(txt)
+        captions = data.get("captions", [])
+        # чистим и фильтруем пустое/повторы
+        clean = []
+        seen = set()
+        for c in captions:
+            if not isinstance(c, str):
+                continue
+            c = c.strip().strip('"').strip()
+            if not c:
+                continue
+            key = c.lower()
+            if key in seen:
+                continue
+            seen.add(key)
+            clean.append(c)
+        return clean[:n] if clean else []
+    except Exception:
+        return []
+
+
+# ===== кэш анализа =====
+# _analysis_cache[sha256] = analysis; LRU
+_analysis_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_analysis_lock = threading.Lock()
+
+
+def analyze_cached(sha: str, image_data_url: str, strict: bool = False) -> Dict[str, Any]:
+    with _analysis_lock:
+        hit = _analysis_cache.get(sha)
+        if hit is not None:
+            _analysis_cache.move_to_end(sha)
+            return hit
+
+    analysis = analyze_image(image_data_url)
+    if analysis == fallback_analysis():
+        # модель ответила не JSON — не запоминаем
+        if strict:
+            raise ValueError("vision: ответ модели не JSON")
+        return analysis
+
+    with _analysis_lock:
+        _analysis_cache[sha] = analysis
+        while len(_analysis_cache) > ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return analysis
+
+
+# ===== async-обёртки (OpenAI-клиент синхронный — уводим в потоки) =====
+async def analyze_photo(sha: str, image_data_url: str, strict: bool = False) -> Dict[str, Any]:
+    """strict=False (бот): при ошибке — общий анализ-заглушка. strict=True (batch.py): ошибка наружу."""
+    if strict:
+        return await asyncio.to_thread(analyze_cached, sha, image_data_url, True)
+    try:
+        return await asyncio.to_thread(analyze_cached, sha, image_data_url)
+    except Exception:
+        return fallback_analysis()
+
+
+async def caption_photo(sha: str, image_data_url: str,
+                        gender: str, length: str, mode: str, kind: str,
+                        history: Optional[Deque[ranking.Signature]] = None,
+                        strict: bool = False) -> Dict[str, Any]:
+    """
+    Полный путь для одного фото: анализ (через кэш) + пачка подписей,
+    отфильтрованная и отсортированная ranking.rank_captions (с учётом history, если есть).
+    Возвращает {"analysis": {...}, "captions": [...]}; для safe='no' подписей нет.
+    strict=True: сбой анализа или пустая пачка — исключение, а не заглушка.
+    """
+    analysis = await analyze_photo(sha, image_data_url, strict)
+    if analysis.get("safe") == "no":
+        return {"analysis": analysis, "captions": []}
+    captions = await asyncio.to_thread(generate_batch, analysis, gender, length, mode, kind)
+    captions = ranking.rank_captions(captions, length, history)
+    if strict and not captions:
+        raise ValueError("пустая пачка подписей")
+    return {"analysis": analysis, "captions": captions}
+
+
+async def map_bounded(
+    func: Callable[[Any], Awaitable[Any]],
+    items: Iterable[Any],
+    workers: int,
+) -> AsyncIterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """
+    Прогоняет items через func не более чем по workers одновременно.
+    Отдаёт (item, result, error) по мере готовности, а не в исходном порядке.
+    items читается лениво — можно отдавать генератор по большому каталогу.
+    """
+    async def run(it):
+        try:
+            return it, await func(it), None
+        except Exception as e:
+            return it, None, e
+
+    pending = set()
+    try:
+        for it in items:
+            if len(pending) >= workers:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in finished:
+                    yield t.result()
+            pending.add(asyncio.create_task(run(it)))
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in finished:
+                yield t.result()
+    finally:
+        for t in pending:
+            t.cancel()
@@ -0,0 +1,177 @@
+# media.py — скачивание фото из Telegram для анализа
+# - один общий aiohttp-пул на весь процесс (без пересоздания сессий)
+# - файл стримится кусками сразу в sha256 + base64, без BytesIO и сырых байт в памяти
+# - берём размер фото не больше MAX_SIDE: Telegram уже хранит уменьшенные копии
+# - кэш по file_unique_id: повторное фото не делает get_file и не качается заново
+# - семафор ограничивает число одновременных скачиваний
+
+import os
+import asyncio
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Optional, Tuple, List, Any
+
+import aiohttp
+
+CHUNK_SIZE = 64 * 1024                     # размер куска при стриминге
+MAX_PHOTO_BYTES = 10 * 1024 * 1024         # больше — не качаем (лимит Telegram на фото)
+MAX_SIDE = int(os.getenv("PHOTO_MAX_SIDE", "1280"))   # vision-модели всё равно ужимают
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "8"))
+CACHE_MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+_session: Optional[aiohttp.ClientSession] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+# _cache[file_unique_id] = (sha256, data_url); LRU, ограничен по суммарному размеру
+_cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+_cache_bytes = 0
+
+
+class DataUrlBuilder:
+    """
+    Собирает data URL из потока кусков: по ходу считает sha256 и кодирует base64.
+    Пока качаем, в памяти только base64-буфер и хвост < 3 байт между кусками.
+    Если размер известен заранее (Content-Length) — буфер выделяется один раз.
+    В finish() на мгновение две копии (bytearray -> str: в Python без копии
+    строку не получить), после него — одна.
+    """
+
+    def __init__(self, mime: str = "image/jpeg", max_bytes: int = MAX_PHOTO_BYTES,
+                 expected_size: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._tail = b""
+        prefix = f"data:{mime};base64,".encode("ascii")
+        self._pos = len(prefix)
+        if expected_size:
+            self._out = bytearray(self._pos + (expected_size + 2) // 3 * 4)
+            self._out[:self._pos] = prefix
+        else:
+            self._out = bytearray(prefix)
+
+    def _write(self, encoded: bytes) -> None:
+        end = self._pos + len(encoded)
+        self._out[self._pos:end] = encoded
+        self._pos = end
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise ValueError(f"Фото больше {self.max_bytes} байт")
+        self._sha.update(chunk)
+        view = memoryview(chunk)
+        if self._tail:
+            # дополняем хвост прошлого куска до 3 байт, чтобы не склеивать буферы
+            need = 3 - len(self._tail)
+            head = self._tail + bytes(view[:need])
+            view = view[need:]
+            if len(head) < 3:
+                self._tail = head
+                return
+            self._write(base64.b64encode(head))
+        cut = len(view) - len(view) % 3
+        self._write(base64.b64encode(view[:cut]))
+        self._tail = bytes(view[cut:])
+
+    def finish(self) -> Tuple[str, str]:
+        if self._tail:
+            self._write(base64.b64encode(self._tail))
+            self._tail = b""
+        del self._out[self._pos:]
+        data_url = self._out.decode("ascii")
+        self._out = bytearray()
+        return self._sha.hexdigest(), data_url
+
+
+# ===== пул соединений =====
+def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=60, sock_read=20),
+        )
+    return _session
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    return _semaphore
+
+
+async def close_session() -> None:
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+# ===== кэш =====
+def _cache_get(unique_id: str) -> Optional[Tuple[str, str]]:
+    hit = _cache.get(unique_id)
+    if hit is not None:
+        _cache.move_to_end(unique_id)
+    return hit
+
+
+def _cache_put(unique_id: str, value: Tuple[str, str]) -> None:
+    global _cache_bytes
+    size = len(value[1])
+    if size > CACHE_MAX_BYTES:
+        return
+    old = _cache.pop(unique_id, None)
+    if old is not None:
+        _cache_bytes -= len(old[1])
+    _cache[unique_id] = value
+    _cache_bytes += size
+    while _cache_bytes > CACHE_MAX_BYTES and _cache:
+        _, (_, evicted) = _cache.popitem(last=False)
+        _cache_bytes -= len(evicted)
+
+
+# ===== скачивание =====
+def pick_photo_size(sizes: List[Any], max_side: int = MAX_SIDE) -> Any:
+    """
+    Из message.photo (отсортированы по возрастанию) берём самый большой размер,
+    который не превышает max_side. Если все больше — самый маленький.
+    """
+    fit = [p for p in sizes if max(p.width, p.height) <= max_side]
+    return fit[-1] if fit else sizes[0]
+
+
+async def stream_to_data_url(url: str, mime: str = "image/jpeg") -> Tuple[str, str]:
+    async with get_session().get(url) as resp:
+        resp.raise_for_status()
+        if resp.content_length and resp.content_length > MAX_PHOTO_BYTES:
+            raise ValueError(f"Фото больше {MAX_PHOTO_BYTES} байт")
+        builder = DataUrlBuilder(mime, expected_size=resp.content_length)
+        async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+            builder.feed(chunk)
+    return builder.finish()
+
+
+async def fetch_photo(bot: Any, sizes: List[Any]) -> Tuple[str, str]:
+    """
+    Возвращает (sha256, data_url) для фото из сообщения.
+    Повторное фото (тот же file_unique_id) отдаётся из кэша без запросов к Telegram.
+    """
+    ph = pick_photo_size(sizes)
+    hit = _cache_get(ph.file_unique_id)
+    if hit is not None:
+        return hit
+
+    async with _get_semaphore():
+        # пока ждали слот, это же фото мог скачать другой запрос
+        hit = _cache_get(ph.file_unique_id)
+        if hit is not None:
+            return hit
+        f = await bot.get_file(ph.file_id)
+        url = bot.session.api.file_url(bot.token, f.file_path)
+        result = await stream_to_data_url(url)
+
+    _cache_put(ph.file_unique_id, result)
+    return result
@@ -0,0 +1,148 @@
+# ranking.py — пост-обработка пачки подписей перед показом
+# - почти-дубли: символьные 3-граммы + MinHash, сравниваем с пачкой и с историей юзера
+# - клише из промпта (BANNED_CLICHES) ловим по явно заданным формам (CLICHE_PATTERNS)
+# - длина против настройки short/medium
+# - выжившие сортируются по оценке: лучшая подпись идёт первой
+# - не выжил никто — отдаём отсеянное (наименее похожее первым), а не пустую пачку
+# Без внешних зависимостей: на пачку из 10 подписей — пара миллисекунд.
+
+import re
+import hashlib
+from collections import deque
+from typing import List, Optional, Deque, Tuple, Dict
+
+SHINGLE_N = 3
+NUM_PERM = 32
+NEAR_DUP = 0.5          # оценка Жаккара по MinHash, выше — считаем повтором
+HISTORY_SIZE = 50       # сколько показанных подписей помним на пользователя
+
+# Запрещённые клише — эти же строки уходят в промпт (captions.generate_batch)
+BANNED_CLICHES = [
+    "мечты",
+    "успех",
+    "будь собой",
+    "никогда не сдавайся",
+    "живи моментом",
+    "всё возможно",
+    "счастье в мелочах",
+    "внутренняя сила",
+]
+
+# Формы клише (ищем в тексте в нижнем регистре, ё -> е, пунктуация сохранена).
+# Основы пишем руками: автоматическая обрезка окончаний ловит “успею”, “всем возможным”.
+# Между словами — только пробелы/тире: “всё, возможно, …” — не клише.
+_S = r"[\s—–-]+"
+CLICHE_PATTERNS: Dict[str, str] = {
+    "мечты": r"\bмечт\w*",
+    "успех": r"\b(успех\w*|успешн\w*)",
+    "будь собой": rf"\bбудь(те)?{_S}(собой|собою)\b",
+    "никогда не сдавайся": rf"\bникогда{_S}не{_S}сдава(йся|йтесь|ться)\b",
+    "живи моментом": rf"\b(живи|живите|живу|живем){_S}(этим{_S})?моментом\b",
+    "всё возможно": rf"\bвсе{_S}возможно\b",
+    "счастье в мелочах": rf"\bсчасть[ея]{_S}в{_S}мелочах\b",
+    "внутренняя сила": rf"\bвнутренн(яя|юю|ей|ие|их){_S}сил(а|у|ой|ы)\b",
+}
+assert set(CLICHE_PATTERNS) == set(BANNED_CLICHES)
+
+# (мин, макс) слов и макс строк для настройки length
+LENGTH_RULES: Dict[str, Tuple[int, int, int]] = {
+    "short": (2, 6, 1),
+    "medium": (4, 30, 2),
+}
+
+_PRIME = (1 << 61) - 1
+_PERMS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _PRIME | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _PRIME)
+    for i in range(NUM_PERM)
+]
+_WORD_RE = re.compile(r"\w+")
+
+Signature = Tuple[int, ...]
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower().replace("ё", "е")))
+
+
+_CLICHE_RES = [re.compile(CLICHE_PATTERNS[p]) for p in BANNED_CLICHES]
+
+
+def has_cliche(text: str) -> bool:
+    t = text.lower().replace("ё", "е")
+    return any(r.search(t) for r in _CLICHE_RES)
+
+
+def shingles(text: str, n: int = SHINGLE_N) -> set:
+    t = f" {normalize(text)} "
+    if len(t) <= n:
+        return {t}
+    return {t[i:i + n] for i in range(len(t) - n + 1)}
+
+
+def minhash(text: str) -> Signature:
+    hashes = [
+        int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "big")
+        for s in shingles(text)
+    ]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_PERM
+
+
+def length_fit(text: str, length: str) -> float:
+    """1.0 — в рамках настройки, дальше плавно падает к 0."""
+    lo, hi, max_lines = LENGTH_RULES.get(length, LENGTH_RULES["medium"])
+    words = len(normalize(text).split())
+    lines = text.count("\n") + 1
+    if lines > max_lines:
+        return 0.0
+    if words < lo:
+        return max(0.0, 1 - (lo - words) / lo)
+    if words > hi:
+        return max(0.0, 1 - (words - hi) / hi)
+    return 1.0
+
+
+def new_history() -> Deque[Signature]:
+    return deque(maxlen=HISTORY_SIZE)
+
+
+def remember(history: Optional[Deque[Signature]], caption: str) -> None:
+    if history is not None:
+        history.append(minhash(caption))
+
+
+def rank_captions(captions: List[str], length: str,
+                  history: Optional[Deque[Signature]] = None) -> List[str]:
+    """
+    Фильтрует клише и почти-дубли (внутри пачки и с историей показанного),
+    остальное сортирует: попадание в длину > новизна > порядок модели.
+    Подписи не той длины не выкидываем, а уводим в конец очереди.
+    Если отсеялось всё — пачка уже оплачена, поэтому вместо пустого списка
+    отдаём отсеянное: почти-дубли от наименее похожего, клише — в самом конце.
+    """
+    seen = list(history or ())
+    scored = []
+    dups = []
+    cliches = []
+    n = len(captions)
+    for i, cap in enumerate(captions):
+        if has_cliche(cap):
+            cliches.append(cap)
+            continue
+        sig = minhash(cap)
+        closest = max((similarity(sig, h) for h in seen), default=0.0)
+        if closest >= NEAR_DUP:
+            dups.append((closest, i, cap))
+            continue
+        seen.append(sig)
+        score = 2.0 * length_fit(cap, length) + (1.0 - closest) + 0.5 * (1 - i / n)
+        scored.append((score, i, cap))
+    if scored:
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [cap for _, _, cap in scored]
+    dups.sort()
+    return [cap for _, _, cap in dups] + cliches
@@ -0,0 +1,245 @@
+# routing.py — какую модель и какой размер пачки брать для каждого вызова OpenAI
+# Стадии:
+# - vision: анализ фото (analyze_image)
+# - first:  первая пачка подписей после фото — человек ждёт прямо сейчас
+# - refill: следующие пачки по “Другая” (только текст, можно дешевле)
+# У каждой стадии список тиров от лучшего к быстрому. Под нагрузкой
+# (много вызовов в полёте или p95 тира выше порога) берём следующий тир.
+# По каждому тиру копим задержки, ошибки и стоимость по usage из ответа.
+#
+# Настройка через env:
+#   MODEL_ROUTES='{"refill": [{"model": "gpt-4o-mini"}, {"model": "gpt-4.1-nano", "batch": 6}]}'
+#   ROUTE_DEPTH_STEPS="8,16"   — с какой глубины очереди спускаемся на 1-й / 2-й тир вниз
+#   ROUTE_P95_SEC="8"          — тир с p95 выше этого пропускаем
+# Для локальной проверки OPENAI_BASE_URL можно направить на фейковый сервер
+# (см. benchmarks/bench_routing.py).
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Deque, Tuple
+
+STAGES = ("vision", "first", "refill")
+
+DEFAULT_ROUTES: Dict[str, List[Dict[str, Any]]] = {
+    "vision": [
+        {"model": "gpt-4o-mini"},
+    ],
+    "first": [
+        {"model": "gpt-4o-mini", "batch": 10},
+        {"model": "gpt-4o-mini", "batch": 6},
+    ],
+    "refill": [
+        {"model": "gpt-4o-mini", "batch": 10},
+        {"model": "gpt-4.1-nano", "batch": 10},
+        {"model": "gpt-4.1-nano", "batch": 5},
+    ],
+}
+
+# $ за 1M токенов (input, output); тир может переопределить через "price": [in, out]
+PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4o": (2.50, 10.00),
+}
+
+TIER_KEYS = ("model", "batch", "price")
+
+WINDOW_SEC = 60.0       # p95 считаем по вызовам за последнюю минуту
+WINDOW_MAX = 200        # и не больше чем по стольким последним
+
+
+class Tier:
+    def __init__(self, stage: str, level: int, model: str, batch: int = 10,
+                 price: Optional[Tuple[float, float]] = None):
+        self.stage = stage
+        self.level = level
+        self.model = model
+        self.batch = batch
+        self.price = tuple(price) if price else PRICES.get(model, (0.0, 0.0))
+        self.calls = 0
+        self.errors = 0
+        self.cost = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=WINDOW_MAX)   # (ts, latency)
+
+    @property
+    def name(self) -> str:
+        return f"{self.stage}/{self.level}:{self.model}x{self.batch}"
+
+    def p95(self, now: Optional[float] = None) -> Optional[float]:
+        now = now or time.monotonic()
+        lat = sorted(l for ts, l in self.samples if now - ts <= WINDOW_SEC)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(len(lat) * 0.95))]
+
+
+class Call:
+    """Один вызов модели: с какого момента мерить задержку и сколько он стоил."""
+
+    def __init__(self, router: "ModelRouter", tier: Tier):
+        self.router = router
+        self.tier = tier
+        self.t0: Optional[float] = None
+
+    def start(self) -> None:
+        self.t0 = time.monotonic()
+
+    def done(self, response: Any) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        inp = int(getattr(usage, "input_tokens", 0) or 0)
+        out = int(getattr(usage, "output_tokens", 0) or 0)
+        price_in, price_out = self.tier.price
+        with self.router._lock:
+            self.tier.input_tokens += inp
+            self.tier.output_tokens += out
+            self.tier.cost += (inp * price_in + out * price_out) / 1_000_000
+
+    def __enter__(self) -> "Call":
+        with self.router._lock:
+            self.router.in_flight += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.router._finish(self, failed=exc_type is not None)
+
+
+def validate_routes(routes: Any) -> None:
+    """Понятная ошибка на старте вместо IndexError/TypeError на каждом вызове модели."""
+    if not isinstance(routes, dict):
+        raise RuntimeError("MODEL_ROUTES: ожидается JSON-объект {стадия: [тиры]}")
+    unknown = set(routes) - set(STAGES)
+    if unknown:
+        raise RuntimeError(f"MODEL_ROUTES: неизвестные стадии {sorted(unknown)} (можно: {', '.join(STAGES)})")
+    for stage, tiers in routes.items():
+        if not isinstance(tiers, list) or not tiers:
+            raise RuntimeError(f"MODEL_ROUTES[{stage}]: нужен непустой список тиров")
+        for i, cfg in enumerate(tiers):
+            where = f"MODEL_ROUTES[{stage}][{i}]"
+            if not isinstance(cfg, dict):
+                raise RuntimeError(f"{where}: тир должен быть объектом, например {{\"model\": \"gpt-4o-mini\"}}")
+            extra = set(cfg) - set(TIER_KEYS)
+            if extra:
+                raise RuntimeError(f"{where}: неизвестные ключи {sorted(extra)} (можно: {', '.join(TIER_KEYS)})")
+            if not isinstance(cfg.get("model"), str) or not cfg["model"].strip():
+                raise RuntimeError(f"{where}: нет model")
+            batch = cfg.get("batch", 10)
+            if not isinstance(batch, int) or isinstance(batch, bool) or batch < 1:
+                raise RuntimeError(f"{where}: batch должен быть целым >= 1")
+            price = cfg.get("price")
+            if price is not None and (
+                not isinstance(price, (list, tuple)) or len(price) != 2
+                or not all(isinstance(p, (int, float)) and not isinstance(p, bool) for p in price)
+            ):
+                raise RuntimeError(f"{where}: price — [вход, выход] в $ за 1M токенов")
+
+
+class ModelRouter:
+    def __init__(self, routes: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                 depth_steps: Tuple[int, ...] = (8, 16), p95_sec: float = 8.0):
+        validate_routes(routes or {})
+        routes = {**DEFAULT_ROUTES, **(routes or {})}
+        self.tiers: Dict[str, List[Tier]] = {
+            stage: [Tier(stage, i, **cfg) for i, cfg in enumerate(routes[stage])]
+            for stage in STAGES
+        }
+        self.depth_steps = tuple(sorted(depth_steps))
+        self.p95_sec = p95_sec
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def pick(self, stage: str) -> Tier:
+        """
+        Базовый тир — по глубине очереди (сколько шагов depth_steps пройдено),
+        дальше пропускаем тиры, у которых p95 за окно выше порога.
+        Последний тир берём всегда, даже если он медленный.
+        """
+        tiers = self.tiers[stage]
+        now = time.monotonic()
+        with self._lock:
+            level = sum(1 for step in self.depth_steps if self.in_flight >= step)
+            for tier in tiers[min(level, len(tiers) - 1):-1]:
+                p95 = tier.p95(now)
+                if p95 is None or p95 <= self.p95_sec:
+                    return tier
+        return tiers[-1]
+
+    def call(self, stage: str) -> Call:
+        """
+        Тир выбирается сразу (call.tier), в очереди вызов считается внутри with:
+        with router.call("first") as call:
+            limiter.acquire()            # ожидание лимитера — тоже очередь, но не задержка модели
+            call.start()
+            r = client.responses.create(model=call.tier.model, ...)
+            call.done(r)
+        """
+        return Call(self, self.pick(stage))
+
+    def _finish(self, call: Call, failed: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self.in_flight -= 1
+            call.tier.calls += 1
+            if failed:
+                call.tier.errors += 1
+            elif call.t0 is not None:
+                call.tier.samples.append((now, now - call.t0))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            out = {"in_flight": self.in_flight, "tiers": {}}
+            for tiers in self.tiers.values():
+                for t in tiers:
+                    p95 = t.p95(now)
+                    out["tiers"][t.name] = {
+                        "calls": t.calls,
+                        "errors": t.errors,
+                        "p95_sec": round(p95, 3) if p95 is not None else None,
+                        "input_tokens": t.input_tokens,
+                        "output_tokens": t.output_tokens,
+                        "cost_usd": round(t.cost, 6),
+                    }
+            return out
+
+
+def from_env() -> ModelRouter:
+    try:
+        routes = json.loads(os.getenv("MODEL_ROUTES") or "{}")
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"MODEL_ROUTES: невалидный JSON ({e})")
+    try:
+        steps = tuple(int(x) for x in os.getenv("ROUTE_DEPTH_STEPS", "8,16").split(",") if x.strip())
+        p95_sec = float(os.getenv("ROUTE_P95_SEC", "8"))
+    except ValueError as e:
+        raise RuntimeError(f"ROUTE_DEPTH_STEPS / ROUTE_P95_SEC: {e}")
+    return ModelRouter(routes, depth_steps=steps, p95_sec=p95_sec)
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def init_router() -> ModelRouter:
+    """Собирает роутер из env заново. Зовём на старте (create_app, batch.py), чтобы кривой конфиг падал сразу."""
+    global _router
+    with _router_lock:
+        _router = from_env()
+    return _router
+
+
+def get_router() -> ModelRouter:
+    # лениво: env (и .env) к этому моменту уже загружены
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = from_env()
+    return _router
@@ -1 +1 @@
-python bot.py
+python app.py
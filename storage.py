@@ -2,9 +2,16 @@ import os
 import json
 import sqlite3
 import time
+import threading
 from typing import Optional, Dict, Any, List, Tuple
 
 DB_PATH = os.getenv("DB_PATH", "data.db")
+HISTORY_KEEP = int(os.getenv("HISTORY_KEEP", "200"))   # сколько показанных подписей храним на юзера
+
+# кэш счётчиков избранного: user_id -> n (источник правды — таблица favorite_counts)
+# хэндлеры зовут storage из потоков (asyncio.to_thread) — кэш правим под замком
+_fav_counts: Dict[int, int] = {}
+_fav_lock = threading.Lock()
 
 
 def _conn():
@@ -54,7 +61,48 @@ def init_db():
             created_at REAL NOT NULL
         )
         """)
+        # keyset-пагинация и подсчёт по пользователю без полного скана
+        c.execute("CREATE INDEX IF NOT EXISTS idx_favorites_user_id ON favorites (user_id, id)")
+        has_unique = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_favorites_user_caption'"
+        ).fetchone()
+        if not has_unique:
+            # старая БД могла накопить дубли — оставляем самую раннюю запись
+            c.execute("""
+            DELETE FROM favorites WHERE id NOT IN (
+                SELECT MIN(id) FROM favorites GROUP BY user_id, caption
+            )
+            """)
+            # повторная ⭐ — INSERT OR IGNORE по этому индексу, без скана избранного юзера
+            c.execute("CREATE UNIQUE INDEX idx_favorites_user_caption ON favorites (user_id, caption)")
+        has_counts = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='favorite_counts'"
+        ).fetchone()
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS favorite_counts (
+            user_id INTEGER PRIMARY KEY,
+            n INTEGER NOT NULL DEFAULT 0
+        )
+        """)
+        if not has_counts or not has_unique:
+            # старая БД: один раз досчитываем счётчики по уже сохранённому избранному
+            c.execute("DELETE FROM favorite_counts")
+            c.execute("""
+            INSERT INTO favorite_counts (user_id, n)
+            SELECT user_id, COUNT(*) FROM favorites GROUP BY user_id
+            """)
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            caption TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_history_user_id ON history (user_id, id)")
         c.commit()
+    with _fav_lock:
+        _fav_counts.clear()
 
 
 def now() -> float:
@@ -136,27 +184,80 @@ def load_analysis(user_id: int) -> Optional[Dict[str, Any]]:
             return None
 
 
-def add_favorite(user_id: int, caption: str):
-    with _conn() as c:
-        c.execute(
-            "INSERT INTO favorites (user_id, caption, created_at) VALUES (?,?,?)",
+def add_favorite(user_id: int, caption: str) -> bool:
+    """Сохраняет подпись в избранное. False — такая подпись у пользователя уже есть."""
+    with _fav_lock, _conn() as c:
+        cur = c.execute(
+            "INSERT OR IGNORE INTO favorites (user_id, caption, created_at) VALUES (?,?,?)",
             (user_id, caption, now())
         )
+        if cur.rowcount == 0:
+            return False
+        c.execute("""
+        INSERT INTO favorite_counts (user_id, n) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET n=n+1
+        """, (user_id,))
         c.commit()
+        if user_id in _fav_counts:
+            _fav_counts[user_id] += 1
+    return True
 
 
-def list_favorites(user_id: int, limit: int = 10) -> List[Tuple[int, str]]:
+def _list_page(table: str, user_id: int, limit: int, before_id: Optional[int]) -> List[Tuple[int, str]]:
     with _conn() as c:
-        rows = c.execute("""
-        SELECT id, caption FROM favorites
-        WHERE user_id=?
-        ORDER BY id DESC
-        LIMIT ?
-        """, (user_id, limit)).fetchall()
+        if before_id is None:
+            rows = c.execute(f"""
+            SELECT id, caption FROM {table}
+            WHERE user_id=?
+            ORDER BY id DESC
+            LIMIT ?
+            """, (user_id, limit)).fetchall()
+        else:
+            rows = c.execute(f"""
+            SELECT id, caption FROM {table}
+            WHERE user_id=? AND id<?
+            ORDER BY id DESC
+            LIMIT ?
+            """, (user_id, before_id, limit)).fetchall()
         return [(r["id"], r["caption"]) for r in rows]
 
 
+def list_favorites(user_id: int, limit: int = 10, before_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    """
+    Страница избранного, новые сверху. Keyset-пагинация по (user_id, id):
+    следующая страница — before_id = id последней записи текущей.
+    Цена страницы не зависит от её номера, в отличие от OFFSET.
+    """
+    return _list_page("favorites", user_id, limit, before_id)
+
+
 def count_favorites(user_id: int) -> int:
+    with _fav_lock:
+        if user_id in _fav_counts:
+            return _fav_counts[user_id]
+        with _conn() as c:
+            row = c.execute("SELECT n FROM favorite_counts WHERE user_id=?", (user_id,)).fetchone()
+        n = int(row["n"]) if row else 0
+        _fav_counts[user_id] = n
+        return n
+
+
+def add_history(user_id: int, caption: str):
+    """Запоминает показанную подпись; у пользователя храним последние HISTORY_KEEP."""
     with _conn() as c:
-        row = c.execute("SELECT COUNT(*) AS n FROM favorites WHERE user_id=?", (user_id,)).fetchone()
-        return int(row["n"])
+        c.execute(
+            "INSERT INTO history (user_id, caption, created_at) VALUES (?,?,?)",
+            (user_id, caption, now())
+        )
+        c.execute("""
+        DELETE FROM history
+        WHERE user_id=? AND id < (
+            SELECT id FROM history WHERE user_id=? ORDER BY id DESC LIMIT 1 OFFSET ?
+        )
+        """, (user_id, user_id, HISTORY_KEEP - 1))
+        c.commit()
+
+
+def list_history(user_id: int, limit: int = 10, before_id: Optional[int] = None) -> List[Tuple[int, str]]:
+    """Страница истории показанных подписей, новые сверху (keyset, как list_favorites)."""
+    return _list_page("history", user_id, limit, before_id)